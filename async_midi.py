@@ -2,7 +2,7 @@ import rtmidi
 import asyncio
 import aiohttp
 from FX import FXBuild
-from utils import parallel_update_led
+from utils import send_request
 # Storm
 #Mon - 185 - condition to on:  >= multi note on (Over 4 notes) + over 50% velocity
 #BG - 163 - always ON - Brigthness - velocity, color - notr (in blue to white range) (we need to set constant Spped and intensity)
@@ -26,6 +26,12 @@ from utils import parallel_update_led
 ip = "192.168.1.136"
 ip2 = "192.168.1.147"
 
+# host strings are interpolated once here; the hot path only %-formats the ints
+URL_AVG_TMPL = f'http://{ip}/win&A=%d&R=%d&B=%d&G=%d&TT=50'
+URL_AVG_TMPL2 = f'http://{ip2}/win&A=%d&R=%d&B=%d&G=%d&TT=50'
+URL_OFF = f'http://{ip}/win&A=0&TT=0'
+URL_OFF2 = f'http://{ip2}/win&A=0&TT=0'
+
 numOfKeys= 48  # num of Piano Keys
 minKeyValue = 36 # lowest Key note num
 maxKeyValue = 84 # lowest Key note num
@@ -39,46 +45,75 @@ chaseOnBlack = FXBuild("chase",28,"",[0,0,0],200,"","")
 solid = FXBuild("solid", 0, "","","","","")
 
 #piano 6 section - acordding to HSV Coloe RGB graph
-intervals = []
-for i in range(1,7,1):
-    intervals.append((i*interval)+minKeyValue)
+# per-segment start color and per-channel ramp direction for the walk around
+# the outer ring: R -> Y -> G -> C -> B -> M
+RGB_BASE = ((255, 0, 0), (255, 255, 0), (0, 255, 0), (0, 255, 255), (0, 0, 255), (255, 0, 255))
+RGB_SLOPE = ((0, 1, 0), (-1, 0, 0), (0, 0, 1), (0, -1, 0), (1, 0, 0), (0, 0, -1))
 
 midiin = rtmidi.RtMidiIn()
 
-# ****** We need to change it to dic **********
-active_notes = {}  # Store active note numbers
-#active_velocity =set() # Store active note Velocity
+class MidiState:
+    "Live note bookkeeping, passed explicitly so the hot handlers hit locals instead of module globals"
+    __slots__ = ('active_notes', 'n_active', 'red_sum', 'green_sum', 'blue_sum', 'velocity_sum', 'dirty')
+
+    def __init__(self):
+        # note -> (velocity, r, g, b) so note-off subtracts exactly what note-on added
+        self.active_notes = {}
+        self.n_active = 0
+        # running color/velocity sums over the held notes; updated by delta on
+        # note-on/off so the flusher averages in O(1) instead of re-walking
+        # every active note
+        self.red_sum = 0
+        self.green_sum = 0
+        self.blue_sum = 0
+        self.velocity_sum = 0
+        self.dirty = False
 
 
 #full color circle
 def color(note_number):
-    if note_number<intervals[0]:
-        Red = 255
-        Blue = 0
-        Green = int(255*(note_number-minKeyValue)/interval)
-    elif note_number<intervals[1]:
-        Red = int(255*(intervals[1]-note_number)/interval)
-        Blue = 0
-        Green = 255
-    elif note_number<intervals[2]:
-        Red = 0
-        Blue = int(255*(note_number-intervals[2])/interval)
-        Green = 255
-    elif note_number<intervals[3]:
-        Red = 0
-        Blue = 255
-        Green = int(255*(intervals[3]-note_number)/interval)
-    elif note_number<intervals[4]:
-        Red = int(255*(note_number-intervals[4])/interval)
-        Blue = 255
-        Green = 0
-    elif note_number<=intervals[5]:
-        Red = 255
-        Blue = int(255*(intervals[5]-note_number)/interval)
-        Green = 0
+    offset = min(max(note_number - minKeyValue, 0), numOfKeys)
+    seg = min(5, offset * 6 // numOfKeys)
+    step = int(255 * (offset - seg * interval) / interval)
+    base = RGB_BASE[seg]
+    slope = RGB_SLOPE[seg]
+    Red = base[0] + slope[0] * step
+    Green = base[1] + slope[1] * step
+    Blue = base[2] + slope[2] * step
     return Red,Green,Blue
 
 
+# the key range is fixed, so the whole note->RGB mapping is precomputed once
+# and the hot paths do a single index instead of the 6-way branch above
+NOTE_RGB = tuple(color(n) for n in range(minKeyValue, maxKeyValue + 1))
+
+# with a single held note the averaged color is just that note's color, so
+# everything but the velocity is baked into a per-key prefix and the flush
+# becomes one string concat
+URL_NOTE_PREFIX = tuple(f'http://{ip}/win&R={r}&B={b}&G={g}&TT=50&A=' for r, g, b in NOTE_RGB)
+URL_NOTE_PREFIX2 = tuple(f'http://{ip2}/win&R={r}&B={b}&G={g}&TT=50&A=' for r, g, b in NOTE_RGB)
+
+
+MAX_INFLIGHT = 32
+inflight_tasks = set()
+
+COALESCE_MS = 15  # chord notes land within a few ms; one update per window is enough
+
+
+async def update_led(session, urls):
+    await asyncio.gather(*(send_request(session, url) for url in urls))
+
+
+def fire_led(session, urls):
+    "Fire-and-forget LED updates so the MIDI loop never waits on HTTP round-trips"
+    for url in urls:
+        if len(inflight_tasks) >= MAX_INFLIGHT:
+            break
+        task = asyncio.create_task(send_request(session, url))
+        inflight_tasks.add(task)
+        task.add_done_callback(inflight_tasks.discard)
+
+
 async def process_midi_events():
     ports = range(midiin.getPortCount())
     if ports:
@@ -87,83 +122,115 @@ async def process_midi_events():
         midiin.openPort(0)
         print(f"Port {i}: {midiin.getPortName(i)}")
 
-        # set fx setting
-        url = f'http://{ip}/win&A=0&TT=50&FX={chaseOnBlack.index}&SX={chaseOnBlack.speed}&R2={chaseOnBlack.bgcolor[0]}&G2={chaseOnBlack.bgcolor[1]}&B2={chaseOnBlack.bgcolor[2]}'
-        url2 = f'http://{ip2}/win&A=0&TT=50&FX={solid.index}'
-        await parallel_update_led([url, url2])
-
-        # await send_request(url)
-        # await send_request(url2)
-
-        while True:
-            m = midiin.getMessage(0.01)# some timeout in ms
-            if m:
-                await handle_midi_message(m)
+        # one session for the whole run: keeps warm keep-alive sockets to the
+        # WLED controllers instead of a TCP handshake per note. The pool is
+        # sized for the two controllers, and the tight timeout keeps a slow
+        # host from wedging the visual pipeline.
+        connector = aiohttp.TCPConnector(limit=8, limit_per_host=4, keepalive_timeout=30,
+                                         force_close=False, enable_cleanup_closed=True)
+        timeout = aiohttp.ClientTimeout(total=1.0, connect=0.3)
+        session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+        # rtmidi delivers messages from its own I/O thread the moment they
+        # arrive; no polling loop, no timeout-sized read latency
+        queue = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        midiin.setCallback(lambda m: loop.call_soon_threadsafe(queue.put_nowait, m))
+
+        ctx = MidiState()
+        flush_task = asyncio.create_task(flusher(session, ctx))
+        try:
+            # set fx setting
+            url = f'http://{ip}/win&A=0&TT=50&FX={chaseOnBlack.index}&SX={chaseOnBlack.speed}&R2={chaseOnBlack.bgcolor[0]}&G2={chaseOnBlack.bgcolor[1]}&B2={chaseOnBlack.bgcolor[2]}'
+            url2 = f'http://{ip2}/win&A=0&TT=50&FX={solid.index}'
+            await update_led(session, [url, url2])
+
+            while True:
+                m = await queue.get()
+                handle_midi_message(m, ctx)
+        finally:
+            flush_task.cancel()
+            await session.close()
     else:
         print('NO MIDI INPUT PORTS!')
 
-async def handle_midi_message(midi):
-
-    global active_notes
-    #global active_velocity
+def handle_midi_message(midi, ctx):
 
     # each time we receive information, note-on or note-off the state is updated
     # each effect in each vibe is a function of the state, that is, any mutation to the state causing
     # the effect to re-compute its properties. Therefore, we can describe the flow as:
     # information from key -> update-state -> vibe ->  compute new properties/store em -> update led
     # the state contains information about active notes and current velocity
-
-    if midi.isNoteOn():
-        note_number = midi.getNoteNumber()
-        velocity = midi.getVelocity()
-        active_notes[note_number] = velocity
-        #active_velocity.add(velocity)
-        R,G,B = color(note_number)
-
-        print(velocity)
-        url = f'http://{ip}/win&A={active_notes[note_number]}&R={R}&G={G}&B={B}&IX=2'
-        url2 = f'http://{ip2}/win&A={active_notes[note_number]}&R={R}&G={G}&B={B}&IX=2'
-
-        #await send_request(url)
-        #print(f'ON: Note {note_number}, Velocity: {velocity}')
-        # await send_request2(url2)
-        #print(f'ON2: Note {note_number}, Velocity: {velocity}')
-
-    elif midi.isNoteOff():
-        note_number = midi.getNoteNumber()
-        del active_notes[note_number]
-        #print(active_notes)
-        if not active_notes:
-            url = f'http://{ip}/win&A=0&TT=0'
-            url2 =  f'http://{ip2}/win&A=0&TT=0'
-            await parallel_update_led([url, url2])
-            # await send_request(url)
-            # await send_request2(url2)
-       # print(f'OFF: Note {note_number}')
-    if active_notes:
-        total_velocity = sum(active_notes.values()) // len(active_notes.keys())
-        red_sum = green_sum = blue_sum = 0
-
-        for note in active_notes:
-            r, g, b = color(note)
-            red_sum += r
-            green_sum += g
-            blue_sum += b
-
-        red_avg = red_sum // len(active_notes.keys())
-        green_avg = green_sum // len(active_notes.keys())
-        blue_avg = blue_sum // len(active_notes.keys())
-
-        url = f'http://{ip}/win&A={total_velocity}&R={red_avg}&B={blue_avg}&G={green_avg}&TT=50&'
-        url2 = f'http://{ip2}/win&A={total_velocity}&R={red_avg}&B={blue_avg}&G={green_avg}&&TT=50&'
-        await parallel_update_led([url, url2])
-        #print(f'Active notes: {active_notes} {total_velocity} B={blue_avg}&G={green_avg}&R2={green_avg} ')
-
-    elif midi.isController():
-        controller_number = midi.getControllerNumber()
-        controller_value = midi.getControllerValue()
+    # the flusher coalesces all mutations within one window into a single LED update
+
+    # demux on the raw status byte once instead of three isNoteOn/isNoteOff/
+    # isController C->Python calls per message; note-on with velocity 0 is a
+    # note-off per the MIDI spec
+    data = midi.getRawData()
+    status = data[0] & 0xF0
+    active_notes = ctx.active_notes
+
+    if status == 0x90 and data[2] > 0:
+        note_number = data[1]
+        velocity = data[2]
+        if note_number in active_notes:  # retrigger: back out the old contribution
+            v, r, g, b = active_notes[note_number]
+            ctx.red_sum -= r
+            ctx.green_sum -= g
+            ctx.blue_sum -= b
+            ctx.velocity_sum -= v
+        else:
+            ctx.n_active += 1
+        r, g, b = NOTE_RGB[note_number - minKeyValue]
+        active_notes[note_number] = (velocity, r, g, b)
+        ctx.red_sum += r
+        ctx.green_sum += g
+        ctx.blue_sum += b
+        ctx.velocity_sum += velocity
+        ctx.dirty = True
+
+    elif status == 0x80 or status == 0x90:
+        note_number = data[1]
+        entry = active_notes.pop(note_number, None)
+        if entry:
+            v, r, g, b = entry
+            ctx.red_sum -= r
+            ctx.green_sum -= g
+            ctx.blue_sum -= b
+            ctx.velocity_sum -= v
+            ctx.n_active -= 1
+            ctx.dirty = True
+
+    elif status == 0xB0:
+        controller_number = data[1]
+        controller_value = data[2]
         #print(f'CONTROLLER {controller_number}, Value: {controller_value}')
 
+
+async def flusher(session, ctx):
+    "Drains all state changes within a coalesce window into one LED update"
+    while True:
+        await asyncio.sleep(COALESCE_MS / 1000)
+        if not ctx.dirty:
+            continue
+        ctx.dirty = False
+
+        n = ctx.n_active
+        if n == 1:
+            idx = next(iter(ctx.active_notes)) - minKeyValue
+            suffix = str(ctx.velocity_sum)
+            fire_led(session, [URL_NOTE_PREFIX[idx] + suffix, URL_NOTE_PREFIX2[idx] + suffix])
+        elif n:
+            total_velocity = ctx.velocity_sum // n
+            red_avg = ctx.red_sum // n
+            green_avg = ctx.green_sum // n
+            blue_avg = ctx.blue_sum // n
+
+            values = (total_velocity, red_avg, blue_avg, green_avg)
+            fire_led(session, [URL_AVG_TMPL % values, URL_AVG_TMPL2 % values])
+        else:
+            fire_led(session, [URL_OFF, URL_OFF2])
+
 if __name__ == "__main__":
     loop = asyncio.get_event_loop()
     loop.run_until_complete(process_midi_events())
@@ -1,66 +1,104 @@
 from modules import State, Effect, Note2Color
 
-from globals import VELOCITY_MAX_VAL, STORM_BG_BRIGHTNESS_MIN_VAL
+from globals import VELOCITY_MAX_VAL, STORM_BG_BRIGHTNESS_MIN_VAL, MIN_KEY_VAL, MAX_KEY_VAL
 import math
 
 
-def at_least(state: State, num_active_notes: int):
-    return len(state.active_notes2velocity) >= num_active_notes
+def _blue_white(note):
+    intensity = int(255 * (note - MIN_KEY_VAL) / (MAX_KEY_VAL - MIN_KEY_VAL))
+    return intensity, intensity, 255
+
+
+# blue->white ramp over the fixed key range, computed once at import so
+# storm_bg averages with plain indexing instead of per-note float math
+BLUE_WHITE_LUT = tuple(_blue_white(n) for n in range(MIN_KEY_VAL, MAX_KEY_VAL + 1))
+
+
+def at_least(n_active: int, num_active_notes: int):
+    return n_active >= num_active_notes
+
+
+def clamp(value: int, lo: int, hi: int) -> int:
+    "Single-expression clamp used by the per-frame brightness paths"
+    return lo if value < lo else (hi if value > hi else value)
 
 
 def storm_mon(state: State, effect: Effect):
-    effect.is_on = int(at_least(state=state, num_active_notes=4) and state.avg_velocity >= (VELOCITY_MAX_VAL // 2))
+    effect.is_on = int(at_least(state.n_active, 4) and state.avg_velocity >= (VELOCITY_MAX_VAL // 2))
 
 
 def storm_bg(state: State, effect: Effect):
-    effect.brightness = max(STORM_BG_BRIGHTNESS_MIN_VAL, min(VELOCITY_MAX_VAL, state.avg_velocity))
-
-    if len(state.active_notes2velocity) > 0:
-        note2color = [Note2Color.blue_to_white(state, note) for note in state.active_notes2velocity.keys()]
-        rgb = [sum(dim) // len(dim) for dim in zip(*note2color)]
-        effect.primary_color = rgb
+    effect.brightness = clamp(state.avg_velocity, STORM_BG_BRIGHTNESS_MIN_VAL, VELOCITY_MAX_VAL)
+
+    if state.n_active > 0:
+        r = g = b = 0
+        for note in state.active_notes2velocity:
+            rr, gg, bb = BLUE_WHITE_LUT[min(max(note, MIN_KEY_VAL), MAX_KEY_VAL) - MIN_KEY_VAL]
+            r += rr
+            g += gg
+            b += bb
+        n = state.n_active
+        effect.primary_color = (r // n, g // n, b // n)
     else:
         effect.reset()
 
 
 def storm_runner(state: State, effect: Effect):
-    effect.is_on = int(at_least(state=state, num_active_notes=1))
+    effect.is_on = int(at_least(state.n_active, 1))
 
     if effect.is_on:
         effect.speed = state.avg_velocity
         effect.intensity = state.avg_notes
 
 def rainbow_mon(state: State, effect: Effect):
-    effect.is_on = int(at_least(state=state, num_active_notes=1))
+    effect.is_on = int(at_least(state.n_active, 1))
 
 
 def rainbow_bg(state: State, effect: Effect):
-    effect.brightness = max(min(VELOCITY_MAX_VAL, ))
+    effect.brightness = clamp(state.avg_velocity, 0, VELOCITY_MAX_VAL)
 
 
 def rainbow_runner(state: State, effect: Effect):
-    pass
+    effect.is_on = int(at_least(state.n_active, 1))
+
+    if effect.is_on:
+        # the dict is non-empty whenever is_on holds; next(iter(...)) grabs a
+        # note without materializing the full key list
+        first_note = next(iter(state.active_notes2velocity))
+        effect.primary_color = Note2Color.circumference_color(state, first_note)
+        effect.speed = state.avg_velocity
+        effect.brightness = state.avg_velocity
+        effect.intensity = state.avg_notes
 
 
 def spring_mon(state: State, effect: Effect):
-    effect.is_on = int(at_least(state=state, num_active_notes=4) and state.avg_velocity >= (VELOCITY_MAX_VAL // 2))
+    effect.is_on = int(at_least(state.n_active, 4) and state.avg_velocity >= (VELOCITY_MAX_VAL // 2))
 
 
 def spring_bg(state: State, effect: Effect):
-    effect.brightness = max(min(VELOCITY_MAX_VAL, ))
+    effect.brightness = clamp(state.avg_velocity, 0, VELOCITY_MAX_VAL)
 
 
 def spring_runner(state: State, effect: Effect):
     pass
 
 
+# red / orange / yellow / white summer palette, indexed by velocity bucket
+SUMMER_COLORS = ((255, 0, 0), (255, 165, 0), (255, 255, 0), (255, 255, 255))
+
+
 def summer_mon(state: State, effect: Effect):
-    effect.is_on = int(at_least(state=state, num_active_notes=4) and state.avg_velocity >= (VELOCITY_MAX_VAL // 2))
+    effect.is_on = int(at_least(state.n_active, 4) and state.avg_velocity >= (VELOCITY_MAX_VAL // 2))
 
 
 def summer_bg(state: State, effect: Effect):
-    effect.brightness = max(min(VELOCITY_MAX_VAL, ))
+    effect.brightness = clamp(state.avg_velocity, 0, VELOCITY_MAX_VAL)
 
 
 def summer_runner(state: State, effect: Effect):
-    pass
+    effect.is_on = int(at_least(state.n_active, 1))
+
+    if effect.is_on:
+        velocity = state.avg_velocity
+        effect.primary_color = SUMMER_COLORS[(velocity >> 6) & 3]
+        effect.brightness = velocity
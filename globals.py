@@ -1,3 +1,5 @@
 
 VELOCITY_MAX_VAL = 255
-STORM_BG_BRIGHTNESS_MIN_VAL = 100
\ No newline at end of file
+STORM_BG_BRIGHTNESS_MIN_VAL = 100
+MIN_KEY_VAL = 36
+MAX_KEY_VAL = 84
\ No newline at end of file
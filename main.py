@@ -1,7 +1,7 @@
 from modules import Vibe, State, Effect, VibeController, LEDZone
 import asyncio
 import rtmidi
-from globals import STORM_BG_BRIGHTNESS_MIN_VAL
+from globals import STORM_BG_BRIGHTNESS_MIN_VAL, MIN_KEY_VAL, MAX_KEY_VAL
 from behaviors import storm_mon, storm_bg, storm_runner
 from utils import connect_devices, system_report
 
@@ -33,8 +33,38 @@ def init_vibes() -> VibeController:
     return controller
 
 
+RENDER_INTERVAL_S = 0.05
+
+
+async def midi_consumer(queue: asyncio.Queue, state: State):
+    while True:
+        m = await queue.get()
+        state.apply_(m)
+
+        # chords land as a burst of messages; drain whatever else is already
+        # queued and reduce the stats once for the whole batch
+        while True:
+            try:
+                m = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            state.apply_(m)
+
+        state.reduce_stats_()
+
+
+async def render_ticker(state: State, vibe_controller: VibeController):
+    while True:
+        await asyncio.sleep(RENDER_INTERVAL_S)
+        # idle ticks (or ticks that only saw controller messages) change
+        # nothing the behaviors read, so skip the HTTP fan-out entirely
+        if state.dirty:
+            state.dirty = False
+            await vibe_controller.fire(state)
+
+
 async def main():
-    state = State(min_key_val=36, max_key_val=84, num_intervals=6)
+    state = State(min_key_val=MIN_KEY_VAL, max_key_val=MAX_KEY_VAL, num_intervals=6)
     vibe_controller = init_vibes()
     connect_devices(vibe_controller)
 
@@ -50,12 +80,16 @@ async def main():
         await vibe_controller.set_specific_vibe('storm')
         system_report(vibe_controller)
 
+        # rtmidi pushes messages from its own I/O thread, so the loop only
+        # wakes on real events and on the fixed render cadence instead of
+        # busy-polling getMessage at ~1 kHz
+        queue = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        midi_in.setCallback(lambda m: loop.call_soon_threadsafe(queue.put_nowait, m))
+
         # TODO: recovery from router restart
-        while True:
-            m = midi_in.getMessage(0.01)  # some timeout in ms
-            if m:
-                state.update(m)
-                await vibe_controller.fire(state)
+        await asyncio.gather(midi_consumer(queue, state),
+                             render_ticker(state, vibe_controller))
     else:
         print('NO MIDI INPUT PORTS!')
 
@@ -1,9 +1,13 @@
-from typing import Optional, Callable
-from dataclasses import dataclass, field, fields, asdict
+from typing import Optional, Callable, ClassVar
+from dataclasses import dataclass, field, fields
+from functools import lru_cache
 import urllib.parse
 import random
+import logging
 from utils import parallel_update_led
 
+logger = logging.getLogger(__name__)
+
 
 class State:
     def __init__(self, min_key_val=36, max_key_val=84, num_intervals=6):
@@ -19,53 +23,103 @@ class State:
         intervals = []
         for i in range(1, self.num_intervals + 1):
             intervals.append((i * interval_size) + self.min_key_val)
-        self.intervals = intervals
+        # immutable so the color mappers can key their caches on it
+        self.intervals = tuple(intervals)
+
+        # the key range is fixed per State, so both note->color mappings are
+        # materialized once here and lookups become a single index
+        key_range = range(self.min_key_val, self.max_key_val + 1)
+        self.blue_to_white_lut = tuple(
+            Note2Color._blue_to_white(self.min_key_val, self.max_key_val, n) for n in key_range)
+        self.circumference_lut = tuple(
+            Note2Color._circumference_color(self.min_key_val, self.interval, n) for n in key_range)
 
         self.avg_notes = 0
         self.avg_velocity = 0
+        self.n_active = 0
+        self.dirty = False
+
+        # running totals over the held notes, updated by delta in apply_ so
+        # reduce_stats_ never re-sums the dict
+        self._notes_sum = 0
+        self._vel_sum = 0
 
         self.history = {}
 
     def update(self, midi) -> None:
         """@Pre: midi is on or off."""
+        self.apply_(midi)
+        self.reduce_stats_()
+
+    def apply_(self, midi) -> None:
+        """Applies one message to the active notes without reducing stats,
+        so a burst of messages can be drained before one reduce_stats_()."""
         note_number = midi.getNoteNumber()
         if midi.isNoteOn():
             velocity = midi.getVelocity()
+            old_velocity = self.active_notes2velocity.get(note_number)
+            if old_velocity is None:
+                self._notes_sum += note_number
+            else:  # retrigger: only the velocity contribution changes
+                self._vel_sum -= old_velocity
             self.active_notes2velocity[note_number] = velocity
+            self._vel_sum += velocity
+            self.dirty = True
         elif midi.isNoteOff():
-            del self.active_notes2velocity[note_number]
-
-        self.reduce_stats_()
+            velocity = self.active_notes2velocity.pop(note_number)
+            self._notes_sum -= note_number
+            self._vel_sum -= velocity
+            self.dirty = True
 
     def reduce_stats_(self):
-        if len(self.active_notes2velocity) > 0:
-            self.avg_notes = sum(self.active_notes2velocity.keys()) // len(self.active_notes2velocity)
-            self.avg_velocity = sum(self.active_notes2velocity.values()) // len(self.active_notes2velocity)
-
-
-def request_alias(name: str) -> dict:
-    return {'alias': name}
+        n = len(self.active_notes2velocity)
+        self.n_active = n
+        if n > 0:
+            self.avg_notes = self._notes_sum // n
+            self.avg_velocity = self._vel_sum // n
 
 
-@dataclass
+@dataclass(slots=True)
 class Effect:
     name: str
-    index: int = field(default=None, metadata=request_alias("FX"))
-    is_on: int = field(default=0, metadata=request_alias("T"))
-    brightness: int = field(default=0, metadata=request_alias("A"))
-    transition_time: int = field(default=50, metadata=request_alias("TT"))
-    speed: Optional[int] = field(default=None, metadata=request_alias("SX"))
-    intensity: Optional[int] = field(default=None, metadata=request_alias("IX"))
+    index: int = None
+    is_on: int = 0
+    brightness: int = 0
+    transition_time: int = 50
+    speed: Optional[int] = None
+    intensity: Optional[int] = None
 
     # mark list values with #L_ alias.
-    primary_color: (int, int, int) = field(default=None, metadata=request_alias("#L_R,G,B"))
-    secondary_color: (int, int, int) = field(default=None, metadata=request_alias("#L_R2,G2,B2"))
-    third_color: (int, int, int) = field(default=None, metadata=request_alias("#L_R3,G3,B3"))
+    primary_color: (int, int, int) = None
+    secondary_color: (int, int, int) = None
+    third_color: (int, int, int) = None
+
+    # filled in by __post_init__; declared so they get slots of their own
+    _snapshot: dict = field(init=False, repr=False, compare=False, default=None)
+    _initial_state: dict = field(init=False, repr=False, compare=False, default=None)
+    _quoted_name: str = field(init=False, repr=False, compare=False, default=None)
+
+    # field -> request-parameter alias; a plain class dict beats the
+    # MappingProxy field.metadata lookup the old request_alias scheme needed
+    _ALIASES: ClassVar[dict] = {
+        'index': 'FX',
+        'is_on': 'T',
+        'brightness': 'A',
+        'transition_time': 'TT',
+        'speed': 'SX',
+        'intensity': 'IX',
+        'primary_color': '#L_R,G,B',
+        'secondary_color': '#L_R2,G2,B2',
+        'third_color': '#L_R3,G3,B3',
+    }
 
     def __post_init__(self):
-        # Store a deep copy of the non-None initial state
-        self._snapshot = asdict(self)
-        self._initial_state = {k: v for k, v in asdict(self).items() if v is not None and k not in ['name', 'index']}
+        # shallow snapshot of the initial state: every value is an int, str or
+        # tuple, all immutable, so asdict's recursive copying buys nothing
+        snapshot = {name: getattr(self, name) for name, _ in self._FIELD_SPECS}
+        self._snapshot = snapshot
+        self._initial_state = {k: v for k, v in snapshot.items() if v is not None and k not in ['name', 'index']}
+        self._quoted_name = urllib.parse.quote_plus(self.name)  # the only field that ever needs escaping
 
     def reset(self):
         for f in fields(self):
@@ -73,45 +127,55 @@ class Effect:
                 setattr(self, f.name, self._initial_state[f.name])
 
     def get_changed_fields(self):
-        current_state = asdict(self)
-        changed_params = [key for key in current_state if current_state[key] != self._snapshot[key]]
-        self._snapshot = current_state
+        snapshot = self._snapshot
+        changed_params = []
+        for field_name, _ in self._FIELD_SPECS:
+            value = getattr(self, field_name)
+            if value != snapshot[field_name]:
+                changed_params.append(field_name)
+                snapshot[field_name] = value
         return changed_params
 
     def build_request_str(self, is_init=False) -> str:
-        dataclass_fields = fields(self)
-
         changed_fields = self.get_changed_fields() if not is_init else None
 
-        fields_dict = {
-            f.metadata.get('alias', f.name): getattr(self, f.name)
-            for f in dataclass_fields
-            if is_init or f.name in changed_fields or f.name in ['name', 'index']
-        }
-
-        fields_dict = {k: v for k, v in fields_dict.items() if v is not None}
-
-        # dealing with lists
-        fields_dict = Effect.convert_list_values(fields_dict)
+        # one pass over the specs straight into "k=v" parts: no intermediate
+        # dicts, and only genuine strings pay for quote_plus (nearly every
+        # value is a small int or an int tuple member that needs no escaping)
+        parts = []
+        append = parts.append
+        for field_name, alias in self._FIELD_SPECS:
+            if not (is_init or field_name in changed_fields or field_name in ('name', 'index')):
+                continue
+            value = getattr(self, field_name)
+            if value is None:
+                continue
+            expansion = self._LIST_EXPANSION.get(alias)
+            if expansion is not None:
+                # list value: each sub-key maps to the matching tuple member
+                for k, v in zip(expansion, value):
+                    append(f"{k}={v}")
+            elif type(value) is int:
+                append(f"{alias}={value}")
+            elif field_name == 'name':
+                append(f"name={self._quoted_name}")
+            else:
+                append(f"{alias}={urllib.parse.quote_plus(str(value))}")
 
-        encoded_fields = {k: urllib.parse.quote_plus(str(v)) for k, v in fields_dict.items()}
+        return '&'.join(parts)
 
-        query_string = '&'.join(f"{k}={v}" for k, v in encoded_fields.items())
 
-        return query_string
+# field introspection is static per class; resolve the (attr, alias) pairs once
+# instead of re-walking fields()/asdict() on every request build
+Effect._FIELD_SPECS = tuple((f.name, Effect._ALIASES.get(f.name, f.name))
+                            for f in fields(Effect) if not f.name.startswith('_'))
 
-    @staticmethod
-    def convert_list_values(data: {}) -> {}:
-        "Convert list keys and values, such that each key is mapped to its value"
-        result = {}
-        for key, val in data.items():
-            if key.startswith("#L_"):
-                keys = key.split("_")[1].split(",")
-                for k, v in zip(keys, val):
-                    result[k] = v
-            else:
-                result[key] = val
-        return result
+# the '#L_' aliases are parsed into their sub-key tuples once here rather than
+# splitting the alias string on every request build
+Effect._LIST_EXPANSION = {
+    alias: tuple(alias.split("_")[1].split(","))
+    for alias in Effect._ALIASES.values() if alias.startswith("#L_")
+}
 
 
 BehaviorType = Callable[[State, Effect], None]
@@ -122,14 +186,26 @@ class LEDZone:
         self.effect = effect
         self.behavior = behavior
         self.connections = None
+        self._url_prefixes = ()
+        self._last_state_hash = None
 
-    def compute_properties(self, state: State) -> str:
+    def compute_properties(self, state: State) -> Optional[str]:
+        """Returns the request query string, or None when the state the
+        behavior reads is unchanged since the last call (steady held chord)."""
         if state:
+            state_hash = hash((state.avg_notes, state.avg_velocity,
+                               frozenset(state.active_notes2velocity.items())))
+            if state_hash == self._last_state_hash:
+                return None
+            self._last_state_hash = state_hash
             self.behavior(state, self.effect)
         return self.effect.build_request_str(is_init=state is None)
 
     def set_connection(self, ips: [str]):
         self.connections = ips
+        # the host part never changes per zone; bake it once so the fire loop
+        # only concatenates the query string
+        self._url_prefixes = tuple(f"http://{ip}/win&" for ip in ips)
 
     def is_connected(self):
         return bool(self.connections)
@@ -151,10 +227,14 @@ class Vibe:
 
     def compute_http_requests(self, state: State) -> [str]:
         urls = []
+        append = urls.append
         for zone in self.zones.values():
             if zone.is_connected():
                 props_str = zone.compute_properties(state)
-                urls.extend([f"http://{ip}/win&{props_str}" for ip in zone.connections])
+                if props_str is None:
+                    continue
+                for prefix in zone._url_prefixes:
+                    append(prefix + props_str)
 
         return urls
 
@@ -163,8 +243,11 @@ class VibeController:
     def __init__(self):
         self.vibes = {}
         self.lead_vibe = None
+        self._vibe_names = []  # kept alongside the dict so set_random_vibe doesn't rebuild a list
 
     def add_vibe(self, name: str, vibe: Vibe):
+        if name not in self.vibes:
+            self._vibe_names.append(name)
         self.vibes[name] = vibe
 
     async def fire(self, state: State = None):
@@ -173,14 +256,15 @@ class VibeController:
 
             requests_urls = vibe.compute_http_requests(state)
             if requests_urls:
-                print(requests_urls)
+                # lazy %-formatting: the repr is only built when DEBUG is on
+                logger.debug("firing %s", requests_urls)
                 await parallel_update_led(requests_urls)
 
         else:
             raise ValueError("No lead vibe selected")
 
     async def set_random_vibe(self):
-        self.lead_vibe = random.choice(list(self.vibes.keys()))
+        self.lead_vibe = random.choice(self._vibe_names)
         await self.fire()
 
     async def set_specific_vibe(self, name: str):
@@ -191,43 +275,46 @@ class VibeController:
 
 
 class Note2Color:
+    # both mappers are pure functions of the key range and the note, and only
+    # ~48 distinct notes ever arrive, so the cached cores replace the float
+    # math with a dict hit after warmup
 
     @staticmethod
     def blue_to_white(state: State, note_number: int):
         "maps note number from blue to white in a straight line"
         note = max(state.min_key_val, min(note_number, state.max_key_val))
+        return state.blue_to_white_lut[note - state.min_key_val]
 
-        ratio = (note - state.min_key_val) / (state.max_key_val - state.min_key_val)
+    @staticmethod
+    @lru_cache(maxsize=128)
+    def _blue_to_white(min_key_val: int, max_key_val: int, note_number: int):
+        note = max(min_key_val, min(note_number, max_key_val))
+
+        ratio = (note - min_key_val) / (max_key_val - min_key_val)
 
         intensity = int(255 * ratio)
 
         return intensity, intensity, 255
 
+    # per-segment start color and per-channel ramp direction for the walk
+    # around the outer ring (R -> Y -> G -> C -> B -> M); same tables as the
+    # async_midi color ramp
+    _RGB_BASE = ((255, 0, 0), (255, 255, 0), (0, 255, 0), (0, 255, 255), (0, 0, 255), (255, 0, 255))
+    _RGB_SLOPE = ((0, 1, 0), (-1, 0, 0), (0, 0, 1), (0, -1, 0), (1, 0, 0), (0, 0, -1))
+
     @staticmethod
     def circumference_color(state: State, note_number: int):
         "maps note number into the outer ring of the color circle (from RED to RED)"
-        if note_number < state.intervals[0]:
-            Red = 255
-            Blue = 0
-            Green = int(255 * (note_number - state.min_key_val) / state.interval)
-        elif note_number < state.intervals[1]:
-            Red = int(255 * (state.intervals[1] - note_number) / state.interval)
-            Blue = 0
-            Green = 255
-        elif note_number < state.intervals[2]:
-            Red = 0
-            Blue = int(255 * (note_number - state.intervals[2]) / state.interval)
-            Green = 255
-        elif note_number < state.intervals[3]:
-            Red = 0
-            Blue = 255
-            Green = int(255 * (state.intervals[3] - note_number) / state.interval)
-        elif note_number < state.intervals[4]:
-            Red = int(255 * (note_number - state.intervals[4]) / state.interval)
-            Blue = 255
-            Green = 0
-        elif note_number <= state.intervals[5]:
-            Red = 255
-            Blue = int(255 * (state.intervals[5] - note_number) / state.interval)
-            Green = 0
-        return Red, Green, Blue
+        note = max(state.min_key_val, min(note_number, state.max_key_val))
+        return state.circumference_lut[note - state.min_key_val]
+
+    @staticmethod
+    @lru_cache(maxsize=128)
+    def _circumference_color(min_key_val: int, interval: float, note_number: int):
+        num_of_keys = int(interval * 6)
+        offset = min(max(note_number - min_key_val, 0), num_of_keys)
+        seg = min(5, offset * 6 // num_of_keys)
+        step = int(255 * (offset - seg * interval) / interval)
+        base = Note2Color._RGB_BASE[seg]
+        slope = Note2Color._RGB_SLOPE[seg]
+        return base[0] + slope[0] * step, base[1] + slope[1] * step, base[2] + slope[2] * step
@@ -1,18 +1,42 @@
 import aiohttp
 import asyncio
-from typing import List
+from typing import List, Optional
 import warnings
 import json
 
+_SESSION: Optional[aiohttp.ClientSession] = None
+
+
+async def get_session() -> aiohttp.ClientSession:
+    "Lazily builds the shared session so every LED update reuses warm keep-alive sockets"
+    global _SESSION
+    if _SESSION is None or _SESSION.closed:
+        connector = aiohttp.TCPConnector(limit_per_host=64, keepalive_timeout=30)
+        # a stalled controller must not wedge the render loop
+        timeout = aiohttp.ClientTimeout(total=1.0)
+        _SESSION = aiohttp.ClientSession(connector=connector, timeout=timeout)
+    return _SESSION
+
+
+async def close_session():
+    global _SESSION
+    if _SESSION is not None:
+        await _SESSION.close()
+        _SESSION = None
+
+
 async def send_request(session, url):
-    async with session.get(url) as response:
+    # only the status is used; skip redirect handling and leave the tiny XML
+    # body unread (the context exit releases the connection back to the pool)
+    async with session.get(url, allow_redirects=False) as response:
         return response.status
 
 
 async def parallel_update_led(urls: List[str]):
-    async with aiohttp.ClientSession() as session:
-        tasks = [send_request(session, url) for url in urls]
-        await asyncio.gather(*tasks)
+    session = await get_session()
+    tasks = [send_request(session, url) for url in urls]
+    # one unreachable controller must not cancel the updates to the others
+    await asyncio.gather(*tasks, return_exceptions=True)
 
 
 def connect_devices(vibe_controller, file_path='./device_conf.json'):
@@ -20,12 +44,17 @@ def connect_devices(vibe_controller, file_path='./device_conf.json'):
     with open(file_path) as f:
         conf = json.load(f)
 
-        for vibe in vibe_controller.vibes.values():
-            for name in conf.keys():
-                if conf[name]:
-                    vibe.set_connection(name, conf[name])
-                else:
-                    warnings.warn(f"Zone {name} isn't configured")
+    # validate the config once up front instead of re-warning per vibe
+    configured = {}
+    for name, ips in conf.items():
+        if ips:
+            configured[name] = ips
+        else:
+            warnings.warn(f"Zone {name} isn't configured")
+
+    for vibe in vibe_controller.vibes.values():
+        for name, ips in configured.items():
+            vibe.set_connection(name, ips)
 
 
 def system_report(vibe_controller):